@@ -0,0 +1,803 @@
+import pandas as pd
+import numpy as np
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from functools import partial
+from operator import itemgetter
+from pathlib import Path
+
+from retraction_classification import LIST_OF_MARKS, classify_retractions
+
+# orjson is optional - it encodes indented JSON in C, several times faster than the json module
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# msgspec is optional - its C encoder is much faster than the json module when installed
+try:
+    import msgspec
+    MSGSPEC_AVAILABLE = True
+except ImportError:
+    MSGSPEC_AVAILABLE = False
+
+# rapidfuzz is optional - its Indel similarity cheaply bounds the SequenceMatcher ratio
+try:
+    from rapidfuzz.distance import Indel
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+
+# pyarrow is optional - its multithreaded CSV reader is much faster than pandas' default engine
+try:
+    import pyarrow
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Columns of the per-country statistics table built by aggregate_country_tables
+STATS_COLUMNS = ['alterations', 'research', 'integrity', 'supplemental', 'system', 'total', 'total_from_1996']
+STATS_YEARS = list(range(1996, 2025))
+
+# Shared state of process pool workers, set once per worker by map_in_process_pool
+_POOL_CONTEXT = {}
+
+# Classification keyword files (<mark>.txt), used by apply_retraction_classification
+CLASSIFICATION_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'classification')
+
+# Fuzzy country matches (Retraction Watch -> Scimago), shared by both dashboard scripts
+COUNTRY_MATCHES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'country_matches.txt')
+
+# Parsed country matches per file, keyed by path -> (mtime_ns, matches)
+_EXISTING_MATCHES_CACHE = {}
+# One "name -> name" pair per line (neither side containing " -> "), skipping the header lines;
+# [^\S\n] is whitespace other than a newline, so a match never spans lines
+_MATCH_LINE_RE = re.compile(r'^(?!=|Country)[^\S\n]*((?:(?! -> )[^\n])+?) -> ((?:(?! -> )[^\n])+?)[^\S\n]*$',
+                            re.MULTILINE)
+
+def map_distinct(series, parse):
+    """
+    Apply parse once per distinct value of series, since many records share the same
+    date or subject. Returns a Series like series.apply(parse).
+    """
+    return series.map({value: parse(value) for value in series.unique()})
+
+def apply_retraction_classification(df):
+    """
+    Apply retraction_classification.py logic to add a 'mark' column, using the keyword
+    files in the classification folder.
+    Processes categories in order: Supplemental, System, Research, Integrity, Serious
+    The last matching category wins (see classify_retractions).
+    Returns DataFrame with a categorical 'mark' column.
+    """
+    # Classify with the marks whose keyword files exist, keeping their order
+    marks = []
+    for mark in LIST_OF_MARKS:
+        file_path = os.path.join(CLASSIFICATION_FOLDER, mark + '.txt')
+        if os.path.exists(file_path):
+            marks.append(mark)
+        else:
+            print(f"Warning: Classification file not found: {file_path}")
+    classify_retractions(df, marks, CLASSIFICATION_FOLDER)
+    
+    # Count how many records got marked
+    marked_count = df['mark'].notna().sum()
+    unmarked_count = df['mark'].isna().sum()
+    
+    # Assign unmarked records to 'Research' as default category
+    # This ensures all records are classified and sum of categories equals total
+    if unmarked_count > 0:
+        df.loc[df['mark'].isna(), 'mark'] = 'Research'
+        print(f"Applied classification: {marked_count} records marked, {unmarked_count} unmarked records assigned to 'Research'")
+    else:
+        print(f"Applied classification: {marked_count} records marked out of {len(df)}")
+    
+    # Low-cardinality column: store as a categorical over the five marks
+    df['mark'] = pd.Categorical(df['mark'], categories=list(LIST_OF_MARKS))
+    
+    return df
+
+def get_country_flag_path(country_name):
+    """
+    Generate country flag path from country name.
+    """
+    # Replace special characters and spaces
+    flag_name = country_name.replace(' ', '_').replace('(', '').replace(')', '')
+    # Handle special cases
+    flag_name = flag_name.replace('formerly_Burma', 'formerly_Burma')
+    flag_name = flag_name.replace('&', '_')
+    return f"/country_flags/{flag_name}.svg"
+
+def get_country_flag_paths(country_names):
+    """
+    Generate country flag paths for a batch of country names in one pass.
+    Returns a dict with country name -> flag path.
+    """
+    return {country_name: get_country_flag_path(country_name) for country_name in country_names}
+
+def normalize_country_name(name):
+    """
+    Normalize country name by removing parentheses, 'formerly' notes, and common variations.
+    """
+    import re
+    # Remove content in parentheses (e.g., "Brunei (Brunei Darussalam)" -> "Brunei")
+    name = re.sub(r'\s*\([^)]*\)', '', name)
+    # Remove "formerly" notes (e.g., "Myanmar (formerly Burma)" -> "Myanmar")
+    name = re.sub(r'\s*\(formerly[^)]*\)', '', name, flags=re.IGNORECASE)
+    # Remove common prefixes/suffixes
+    name = name.replace('Island', '').replace('Islands', '').strip()
+    # Normalize common abbreviations
+    name = name.replace('&', 'and').replace('St.', 'Saint').replace('St ', 'Saint ')
+    # Remove extra whitespace
+    name = ' '.join(name.split())
+    return name.strip()
+
+def similarity_ratio(a, b, best_ratio=0):
+    """
+    SequenceMatcher ratio of two strings, skipping the full comparison when a
+    cheap upper bound shows it cannot beat best_ratio.
+    Returns the ratio, or 0 when it cannot exceed best_ratio.
+    """
+    if RAPIDFUZZ_AVAILABLE:
+        # Indel similarity is 2*LCS/(len(a)+len(b)), never below SequenceMatcher's ratio
+        if Indel.normalized_similarity(a, b) < best_ratio - 1e-9:
+            return 0
+        return SequenceMatcher(None, a, b).ratio()
+    
+    matcher = SequenceMatcher(None, a, b)
+    if matcher.real_quick_ratio() <= best_ratio or matcher.quick_ratio() <= best_ratio:
+        return 0
+    return matcher.ratio()
+
+def build_scimago_name_index(scimago_countries):
+    """
+    Index scimago country names by their normalized, lowercased form.
+    Returns dict of normalized name -> first scimago country with that name.
+    """
+    scimago_index = {}
+    for scimago_country in scimago_countries:
+        scimago_index.setdefault(normalize_country_name(scimago_country).lower(), scimago_country)
+    return scimago_index
+
+def find_similar_country(country_name, scimago_countries, threshold=0.7, scimago_index=None):
+    """
+    Find a similar country name in scimago_countries using fuzzy matching.
+    scimago_index (from build_scimago_name_index) is built on the fly if not given.
+    Returns the best match if similarity is above threshold, else None.
+    """
+    # Manual mappings for common cases
+    manual_mappings = {
+        'russia': 'Russian Federation',
+        'brunei': 'Brunei Darussalam',
+        'myanmar': 'Myanmar',
+        'burma': 'Myanmar',
+        'syria': 'Syrian Arab Republic',
+        'north macedonia': 'Macedonia',
+        'macedonia': 'Macedonia',
+        'eswatini': 'Eswatini',
+        'swaziland': 'Eswatini',
+        'republic of the congo': 'Congo',
+        'congo-brazzaville': 'Congo',
+        'réunion island': 'Reunion',
+        'reunion island': 'Reunion',
+        'reunion': 'Reunion',
+        'st. kitts & nevis': 'Saint Kitts and Nevis',
+        'st kitts & nevis': 'Saint Kitts and Nevis',
+        'saint kitts & nevis': 'Saint Kitts and Nevis',
+        'east timor': 'Timor-Leste',
+        'timor-leste': 'Timor-Leste',
+        'sint maarten': 'Netherlands Antilles',  # May not exist, but try
+    }
+    
+    # Normalize the input country name
+    normalized_input = normalize_country_name(country_name).lower()
+    
+    # Check manual mappings first
+    if normalized_input in manual_mappings:
+        mapped = manual_mappings[normalized_input]
+        if mapped in scimago_countries:
+            return mapped
+    
+    # Also check if normalized input matches any part of manual mapping keys
+    for key, mapped in manual_mappings.items():
+        if key in normalized_input or normalized_input in key:
+            if mapped in scimago_countries:
+                return mapped
+    
+    country_name_lower = country_name.lower().strip()
+    normalized_input = normalized_input if normalized_input else country_name_lower
+    
+    # Normalized names that match exactly need no fuzzy scoring
+    if scimago_index is None:
+        scimago_index = build_scimago_name_index(scimago_countries)
+    if normalized_input in scimago_index:
+        return scimago_index[normalized_input]
+    
+    best_match = None
+    best_ratio = 0
+    
+    for scimago_country in scimago_countries:
+        scimago_lower = scimago_country.lower().strip()
+        scimago_normalized = normalize_country_name(scimago_country).lower()
+        
+        # Check if normalized names match exactly
+        if normalized_input == scimago_normalized:
+            return scimago_country
+        
+        # Check if one contains the other (e.g., "Russia" in "Russian Federation")
+        if normalized_input in scimago_lower or scimago_lower in normalized_input:
+            ratio = similarity_ratio(normalized_input, scimago_lower, best_ratio)
+            if ratio > best_ratio:
+                best_ratio = ratio
+                best_match = scimago_country
+        
+        # Check normalized versions
+        if normalized_input in scimago_normalized or scimago_normalized in normalized_input:
+            ratio = similarity_ratio(normalized_input, scimago_normalized, best_ratio)
+            if ratio > best_ratio:
+                best_ratio = ratio
+                best_match = scimago_country
+        
+        # Also check similarity ratio on normalized names
+        ratio = similarity_ratio(normalized_input, scimago_normalized, best_ratio)
+        if ratio > best_ratio:
+            best_ratio = ratio
+            best_match = scimago_country
+        
+        # Check original names too
+        ratio = similarity_ratio(country_name_lower, scimago_lower, best_ratio)
+        if ratio > best_ratio:
+            best_ratio = ratio
+            best_match = scimago_country
+    
+    if best_ratio >= threshold:
+        return best_match
+    return None
+
+def load_yearly_publication_data_from_scimago(scimago_file=None, chunksize=50000):
+    """
+    Load yearly publication data from scimago_combined.csv, reading chunksize rows at a time.
+    Returns: (yearly_publication_data dict, scimago_countries list)
+    yearly_publication_data format: {country: {year: count, ...}, ...}
+    """
+    if scimago_file is None:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        project_root = os.path.dirname(script_dir)
+        scimago_file = os.path.join(project_root, 'data', 'scimago_combined.csv')
+        # Fallback to current directory
+        if not os.path.exists(scimago_file):
+            scimago_file = 'scimago_combined.csv'
+    
+    if not os.path.exists(scimago_file):
+        print(f"Warning: {scimago_file} not found")
+        return {}, []
+    
+    yearly_publication_data = {}
+    scimago_countries = []
+    
+    try:
+        # Get year columns (1996-2024)
+        year_columns = [str(year) for year in range(1996, 2025)]
+        
+        # Stream the file in chunks so memory stays bounded for large files
+        for df in pd.read_csv(scimago_file, chunksize=chunksize):
+            # Convert all year columns at once; missing columns and invalid values become 0.0
+            year_values = df.reindex(columns=year_columns).apply(pd.to_numeric, errors='coerce').fillna(0.0)
+            countries = df['Country'].astype(str).str.strip().tolist()
+            
+            # Load yearly data for each country
+            for country, values in zip(countries, year_values.to_numpy(dtype=float).tolist()):
+                if country:
+                    scimago_countries.append(country)
+                    yearly_publication_data[country] = dict(zip(year_columns, values))
+        
+        print(f"Loaded yearly publication data for {len(yearly_publication_data)} countries from {scimago_file}")
+        
+    except Exception as e:
+        print(f"Warning: Could not load yearly publication data from {scimago_file}: {e}")
+    
+    return yearly_publication_data, scimago_countries
+
+def load_publication_data_from_scimago(scimago_file=None, chunksize=50000):
+    """
+    Load publication data from scimago_combined.csv and sum all years from 1996-2024.
+    The file is read chunksize rows at a time, so memory stays bounded for large files.
+    Returns: (publication_data dict, scimago_countries list)
+    """
+    if scimago_file is None:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        project_root = os.path.dirname(script_dir)
+        scimago_file = os.path.join(project_root, 'data', 'scimago_combined.csv')
+        # Fallback to current directory
+        if not os.path.exists(scimago_file):
+            scimago_file = 'scimago_combined.csv'
+    
+    if not os.path.exists(scimago_file):
+        print(f"Warning: {scimago_file} not found")
+        return {}, []
+    
+    publication_data = {}
+    scimago_countries = []
+    
+    try:
+        for df in pd.read_csv(scimago_file, chunksize=chunksize):
+            # Get year columns (1996-2024) present in the file
+            year_columns = [str(year) for year in range(1996, 2025) if str(year) in df.columns]
+            
+            # Sum all years for each country in one vectorized pass, skipping invalid values
+            totals = df[year_columns].apply(pd.to_numeric, errors='coerce').sum(axis=1).tolist()
+            countries = df['Country'].astype(str).str.strip().tolist()
+            
+            for country, total_publications in zip(countries, totals):
+                if country:
+                    scimago_countries.append(country)
+                    if total_publications > 0:
+                        publication_data[country] = total_publications
+        
+        print(f"Loaded publication data for {len(publication_data)} countries from {scimago_file}")
+        if publication_data:
+            print(f"Total publications range: {min(publication_data.values()):.0f} - {max(publication_data.values()):.0f}")
+        
+    except Exception as e:
+        print(f"Warning: Could not load publication data from {scimago_file}: {e}")
+    
+    return publication_data, scimago_countries
+
+def load_publication_data(publication_file=None):
+    """
+    Load publication data. If no file specified, tries to load from scimago_combined.csv.
+    Expected format: country -> total_publications
+    Returns: (publication_data, scimago_countries)
+    """
+    # Default to scimago_combined.csv if no file specified
+    if publication_file is None:
+        return load_publication_data_from_scimago()
+    
+    if not os.path.exists(publication_file):
+        # Fallback to scimago_combined.csv
+        print(f"Publication file {publication_file} not found, trying scimago_combined.csv")
+        return load_publication_data_from_scimago()
+    
+    publication_data = {}
+    scimago_countries = []
+    
+    try:
+        if publication_file.endswith('.csv'):
+            # Check if it's the scimago format
+            if 'scimago' in publication_file.lower():
+                return load_publication_data_from_scimago(publication_file)
+            
+            # Otherwise, assume simple CSV format
+            df = pd.read_csv(publication_file)
+            if len(df.columns) >= 2:
+                for country, publications in df.iloc[:, :2].itertuples(index=False, name=None):
+                    country = str(country).strip()
+                    if pd.notna(publications):
+                        publication_data[country] = float(publications)
+                        scimago_countries.append(country)
+        elif publication_file.endswith('.json'):
+            if ORJSON_AVAILABLE:
+                with open(publication_file, 'rb') as f:
+                    data = orjson.loads(f.read())
+            else:
+                with open(publication_file, 'r') as f:
+                    data = json.load(f)
+            if isinstance(data, dict):
+                publication_data = data
+                scimago_countries = list(data.keys())
+            elif isinstance(data, list):
+                for item in data:
+                    if 'country' in item and 'publications' in item:
+                        country = item['country']
+                        publication_data[country] = float(item['publications'])
+                        scimago_countries.append(country)
+    except Exception as e:
+        print(f"Warning: Could not load publication data: {e}")
+    
+    return publication_data, scimago_countries
+
+def load_publication_tables(publication_file=None):
+    """
+    Load everything needed for retraction rates in one call: total publications per country
+    (from publication_file, or scimago_combined.csv by default) and yearly publications from scimago_combined.csv.
+    Returns: (publication_data, yearly_publication_data, scimago_countries)
+    """
+    publication_data, scimago_countries = load_publication_data(publication_file)
+    yearly_publication_data, _ = load_yearly_publication_data_from_scimago()
+    return publication_data, yearly_publication_data, scimago_countries
+
+def calculate_retraction_rate(total_retractions, total_publications=None):
+    """
+    Calculate retraction rate per 1000 publications.
+    Formula: (total_retractions / total_publications) * 1000
+    """
+    if total_publications is None or total_publications == 0:
+        return 0.0
+    else:
+        return round((total_retractions / total_publications) * 1000, 4)
+
+def calculate_yearly_retraction_rates(yearly_retractions, yearly_publications=None):
+    """
+    Calculate retraction rate per 1000 publications for each year (1996-2024).
+    Only years with retractions or a rate > 0 are included.
+    Returns a dict with year -> retraction_rate.
+    """
+    return calculate_yearly_retraction_rates_for_all([yearly_retractions], [yearly_publications])[0]
+
+def calculate_yearly_retraction_rates_for_all(yearly_retractions_list, yearly_publications_list):
+    """
+    Calculate yearly retraction rates (see calculate_yearly_retraction_rates) for many countries at once.
+    The retractions and publications are laid out as (countries x years) arrays and divided in one NumPy call.
+    Returns a list of year -> retraction_rate dicts, in the order of the inputs.
+    """
+    years = [str(year) for year in range(1996, 2025)]
+    retractions = np.array([[yearly_retractions.get(year_str, 0) for year_str in years]
+                            for yearly_retractions in yearly_retractions_list], dtype=float).reshape(-1, len(years))
+    publications = np.array([[yearly_publications.get(year_str, 0) for year_str in years] if yearly_publications
+                             else [0] * len(years)
+                             for yearly_publications in yearly_publications_list], dtype=float).reshape(-1, len(years))
+    
+    # Same as calculate_retraction_rate: 0.0 where there are no publications
+    rates = np.divide(retractions, publications, out=np.zeros_like(retractions), where=publications != 0) * 1000
+    include = (rates > 0) | (retractions > 0)
+    
+    return [{year_str: round(rate, 4) for year_str, rate, keep in zip(years, row_rates, row_include) if keep}
+            for row_rates, row_include in zip(rates.tolist(), include.tolist())]
+
+def get_similar_country(country, scimago_countries, match_cache):
+    """
+    Fuzzy match a country name against scimago_countries, at most once per name.
+    Returns the cached result of find_similar_country.
+    """
+    if country not in match_cache:
+        match_cache[country] = find_similar_country(country, scimago_countries)
+    return match_cache[country]
+
+def resolve_publications(country, publications, scimago_countries, match_cache):
+    """
+    Look up a country in a publication table (totals or yearly data), falling back to
+    the fuzzy matched Scimago name when the country itself has no data.
+    Returns (value, matched_country) where matched_country is set only if the fuzzy match supplied the value.
+    """
+    value = publications.get(country)
+    if value or not scimago_countries:
+        return value, None
+    
+    matched_country = get_similar_country(country, scimago_countries, match_cache)
+    if not matched_country:
+        return value, None
+    
+    value = publications.get(matched_country)
+    return value, (matched_country if value else None)
+
+def build_country_row(country, stats, country_flag, publication_data, yearly_publication_data, scimago_countries,
+                      match_cache=None, yearly_retraction_rates=None):
+    """
+    Build the dashboard entry for a single country from its aggregated stats.
+    yearly_retraction_rates may be passed if already calculated (see build_country_rows).
+    Returns (row, matched_country) where matched_country is the Scimago name that was
+    fuzzy matched for publication data, or None if no fuzzy match was needed.
+    """
+    if match_cache is None:
+        match_cache = {}
+    
+    # Total retractions = unique record count (all records, including before 1996)
+    total_retractions = stats['total']
+    
+    # Total retractions from 1996 onwards (for retraction rate calculation)
+    total_retractions_from_1996 = stats['total_from_1996']
+    
+    # Get total publications for this country (1996-2024), fuzzy matching if none found
+    total_publications, publication_match = resolve_publications(country, publication_data, scimago_countries,
+                                                                 match_cache)
+    if publication_match:
+        print(f"Matched '{country}' -> '{publication_match}' for publication data")
+    
+    # Calculate retraction_rate: (total_retractions_from_1996 / total_publications) * 1000
+    retraction_rate = calculate_retraction_rate(total_retractions_from_1996, total_publications)
+    
+    if yearly_retraction_rates is None:
+        # Calculate yearly retraction rates, fuzzy matching if no yearly publication data found
+        country_yearly_pubs, _ = resolve_publications(country, yearly_publication_data, scimago_countries, match_cache)
+        
+        # Calculate retraction rate for each year (1996-2024)
+        yearly_retraction_rates = calculate_yearly_retraction_rates(stats['yearly_retractions'], country_yearly_pubs)
+    
+    row = {
+        'country': country,
+        'alterations': stats['alterations'],
+        'research': stats['research'],
+        'integrity': stats['integrity'],
+        'supplemental': stats['supplemental'],
+        'system': stats['system'],
+        'total': total_retractions,  # All retractions (including before 1996)
+        'total_from_1996': total_retractions_from_1996,  # Retractions from 1996 onwards
+        'total_publications': int(total_publications or 0),  # Total publications (1996-2024)
+        'retraction_rate': retraction_rate,  # (total_from_1996 / total_publications) * 1000
+        'yearly_retraction_rates': yearly_retraction_rates,  # Dict with year -> retraction_rate
+        'country_flag': country_flag
+    }
+    return row, publication_match
+
+def _init_pool_worker(context):
+    """Store the shared state of map_in_process_pool once per worker process."""
+    _POOL_CONTEXT.update(context)
+
+def _call_in_pool_worker(function, item):
+    """Process pool entry point for map_in_process_pool."""
+    return function(item, **_POOL_CONTEXT)
+
+def map_in_process_pool(function, items, workers, context, chunksize=1):
+    """
+    Call function(item, **context) for each item in a process pool of size workers.
+    context (lookup tables, DataFrames, caches) is sent to each worker once rather than with
+    every item; each worker gets its own copy, so caches in it are local to the worker.
+    function must be defined at module level so it can be sent to the workers.
+    Returns the list of results, in the order of items.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_pool_worker, initargs=(context,)) as executor:
+        return list(executor.map(partial(_call_in_pool_worker, function), items, chunksize=chunksize))
+
+def _build_country_row_in_worker(item, **context):
+    """map_in_process_pool entry point for build_country_row."""
+    country, stats, country_flag, yearly_retraction_rates = item
+    return build_country_row(country, stats, country_flag, yearly_retraction_rates=yearly_retraction_rates, **context)
+
+def build_country_rows(country_stats, publication_data, yearly_publication_data, scimago_countries, workers=None,
+                       match_cache=None, country_flags=None):
+    """
+    Build the dashboard entries for all countries.
+    If workers > 1, countries are split across a process pool of that size.
+    match_cache (country -> fuzzy match) and country_flags (country -> flag path) may be shared
+    between calls with the same Scimago data; missing entries are added to them.
+    Returns (result list, country_matches dict of fuzzy matches used for publication data).
+    """
+    if country_flags is None:
+        country_flags = {}
+    country_flags.update(get_country_flag_paths([country for country in country_stats if country not in country_flags]))
+    
+    # Fuzzy match each country missing publication data once, up front
+    if match_cache is None:
+        match_cache = {}
+    if scimago_countries:
+        unmatched = [country for country in country_stats if country not in match_cache
+                     and (not publication_data.get(country) or not yearly_publication_data.get(country))]
+        if unmatched:
+            scimago_index = build_scimago_name_index(scimago_countries)
+            for country in unmatched:
+                match_cache[country] = find_similar_country(country, scimago_countries, scimago_index=scimago_index)
+    
+    # Yearly retraction rates of all countries in one (countries x years) division
+    yearly_publications = [resolve_publications(country, yearly_publication_data, scimago_countries, match_cache)[0]
+                           for country in country_stats]
+    all_yearly_rates = calculate_yearly_retraction_rates_for_all(
+        [stats['yearly_retractions'] for stats in country_stats.values()], yearly_publications)
+    
+    items = [(country, stats, country_flags[country], yearly_rates)
+             for (country, stats), yearly_rates in zip(country_stats.items(), all_yearly_rates)]
+    
+    if workers and workers > 1 and len(items) > 1:
+        chunksize = max(1, len(items) // (4 * workers))
+        context = {'publication_data': publication_data, 'yearly_publication_data': yearly_publication_data,
+                   'scimago_countries': scimago_countries, 'match_cache': match_cache}
+        built = map_in_process_pool(_build_country_row_in_worker, items, workers, context, chunksize)
+    else:
+        built = [build_country_row(country, stats, country_flag, publication_data, yearly_publication_data, scimago_countries,
+                                   match_cache, yearly_rates)
+                 for country, stats, country_flag, yearly_rates in items]
+    
+    result = []
+    country_matches = {}
+    for (country, _, _, _), (row, publication_match) in zip(items, built):
+        result.append(row)
+        if publication_match:
+            country_matches[country] = publication_match
+    
+    return result, country_matches
+
+def _encode_json_orjson(value):
+    """Encode value as UTF-8 JSON indented by 2 spaces with orjson."""
+    # numpy scalars and int keys encode as json.dump would
+    return orjson.dumps(value, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+def _encode_json_msgspec(value):
+    """Encode value as UTF-8 JSON indented by 2 spaces with msgspec."""
+    return msgspec.json.format(msgspec.json.encode(value), indent=2)
+
+def write_json(data, output_json_path):
+    """
+    Write data to output_json_path as JSON indented by 2 spaces.
+    Uses orjson or msgspec when available, otherwise falls back to the json module.
+    With orjson or msgspec, lists are streamed one element at a time, so only a single row is
+    ever encoded in memory rather than the whole document.
+    """
+    if ORJSON_AVAILABLE or MSGSPEC_AVAILABLE:
+        encode = _encode_json_orjson if ORJSON_AVAILABLE else _encode_json_msgspec
+        with open(output_json_path, 'wb', buffering=1024 * 1024) as f:
+            if not isinstance(data, list) or not data:
+                f.write(encode(data))
+            else:
+                # Same layout as json.dump(indent=2): each row nested one level inside the array
+                f.write(b'[\n')
+                for i, row in enumerate(data):
+                    if i:
+                        f.write(b',\n')
+                    f.write(b'  ' + encode(row).replace(b'\n', b'\n  '))
+                f.write(b'\n]')
+    else:
+        # json.dump already writes the encoder's chunks as they are produced; UTF-8 without
+        # escaping, like orjson and msgspec
+        with open(output_json_path, 'w', encoding='utf-8', buffering=1024 * 1024) as f:  # 1 MiB buffer, fewer write() syscalls
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+def aggregate_country_tables(df, year_column):
+    """
+    Aggregate per-country retraction statistics with vectorized pandas operations.
+    The semicolon-separated Country column is treated as a categorical, so only its distinct
+    values are split; they are joined back to one row per record/country pair, then
+    categories, totals and yearly counts are summed with groupby.
+    Returns (category_table, yearly_table): int64 DataFrames indexed by country (in order of
+    first appearance), with columns STATS_COLUMNS and the years 1996-2024 respectively.
+    """
+    # Map mark to category (matching retraction_classification.py mapping)
+    # Supplemental -> supplemental, System -> system, Research -> research, 
+    # Integrity -> integrity, Serious -> alterations
+    mark_to_category = {
+        'Supplemental': 'supplemental',
+        'System': 'system',
+        'Research': 'research',
+        'Integrity': 'integrity',
+        'Serious': 'alterations'
+    }
+    
+    # Work on the distinct Country values; missing values get code -1
+    countries = df['Country'].astype('category')
+    country_values = pd.Series(countries.cat.categories.astype(str))
+    
+    # Skip values that are unknown as a whole, then split countries (can be multiple,
+    # separated by semicolons) into one entry each, keyed by category code
+    has_country = ~country_values.str.lower().isin(['unknown', 'nan', ''])
+    split_countries = country_values[has_country].str.split(';').explode().str.strip()
+    split_countries = split_countries[split_countries.notna() & (split_countries != '')]
+    
+    # One row per record/country pair; a left merge keeps the records' order.
+    # country and category stay categorical, so the groupbys below work on integer codes
+    long_df = pd.DataFrame({
+        'code': countries.cat.codes.to_numpy(),
+        'category': pd.Categorical(df['mark'].map(mark_to_category)),
+        'year': df[year_column].to_numpy()
+    }).merge(pd.DataFrame({'code': split_countries.index, 'country': pd.Categorical(split_countries)}),
+             on='code', how='left')
+    long_df = long_df[long_df['country'].notna()]
+    
+    # Retractions from 1996 onwards (for retraction rate calculation)
+    long_df['from_1996'] = long_df['year'] >= 1996
+    
+    by_country = long_df.groupby('country', sort=False, observed=True)
+    # Plain country names, so the tables below are not indexed by categoricals
+    countries_index = by_country.size().index.astype(object)
+    # Count in only ONE category based on mark (not multiple), one column per category
+    category_table = (long_df.groupby(['country', 'category'], sort=False, observed=True).size()
+                      .unstack(fill_value=0)
+                      .reindex(index=countries_index, columns=STATS_COLUMNS, fill_value=0))
+    category_table['total'] = by_country.size()
+    category_table['total_from_1996'] = by_country['from_1996'].sum()
+    
+    # Track retractions per year (1996-2024), one column per year
+    in_range = long_df[long_df['year'].between(1996, 2024)]
+    yearly_table = (in_range.groupby(['country', in_range['year'].astype('int64')], observed=True).size()
+                    .unstack(fill_value=0)
+                    .reindex(index=countries_index, columns=STATS_YEARS, fill_value=0))
+    
+    return category_table.astype('int64'), yearly_table.astype('int64')
+
+def aggregate_country_stats(df, year_column):
+    """
+    Aggregate per-country retraction statistics (see aggregate_country_tables).
+    Returns a dict with country -> stats (in order of first appearance) as used by build_country_rows;
+    yearly_retractions only holds the years with retractions.
+    """
+    category_table, yearly_table = aggregate_country_tables(df, year_column)
+    
+    # Read the tables column-wise into plain ints, one dict per country
+    year_keys = [str(year) for year in STATS_YEARS]
+    country_stats = {}
+    for country, counts, yearly in zip(category_table.index, category_table.to_numpy().tolist(),
+                                       yearly_table.to_numpy().tolist()):
+        stats = dict(zip(STATS_COLUMNS, counts))
+        stats['yearly_retractions'] = {year: count for year, count in zip(year_keys, yearly) if count}
+        country_stats[country] = stats
+    
+    return country_stats
+
+def read_retraction_csv(csv_file_path, usecols):
+    """
+    Read only the given columns of the Retraction Watch CSV.
+    Uses the pyarrow engine when available, otherwise the default C engine.
+    Returns DataFrame with the low-cardinality Country and RetractionNature as category columns.
+    """
+    engine = 'pyarrow' if PYARROW_AVAILABLE else 'c'
+    return pd.read_csv(csv_file_path, usecols=usecols, engine=engine,
+                       dtype={'Country': 'category', 'RetractionNature': 'category'})
+
+def load_existing_country_matches(matches_file=COUNTRY_MATCHES_FILE):
+    """
+    Load previously saved country matches (Retraction Watch -> Scimago) from the matches file.
+    The parsed matches are cached and the file is only re-read when its mtime changes.
+    """
+    try:
+        mtime_ns = os.stat(matches_file).st_mtime_ns
+    except OSError:
+        return {}
+    
+    cached = _EXISTING_MATCHES_CACHE.get(matches_file)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+    
+    try:
+        with open(matches_file, 'r', encoding='utf-8') as f:
+            text = f.read()
+    except FileNotFoundError:
+        text = ''
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Warning: Could not read {matches_file}: {e}")
+        text = ''
+    
+    # One "Retraction Watch name -> Scimago name" pair per line, skipping the header lines
+    existing_matches = dict(_MATCH_LINE_RE.findall(text))
+    
+    _EXISTING_MATCHES_CACHE[matches_file] = (mtime_ns, existing_matches)
+    return existing_matches
+
+def save_country_matches(country_matches, matches_file=COUNTRY_MATCHES_FILE):
+    """
+    Write the fuzzy country matches (Retraction Watch -> Scimago) to matches_file,
+    country_matches.txt in the project root by default, replacing its contents.
+    """
+    # Build the whole file up front and write it with a single call, via a temp file
+    # so a crash never leaves a truncated matches file
+    # Names are unique, so sorting the pairs in place by name alone matches sorted(items())
+    match_items = list(country_matches.items())
+    match_items.sort(key=itemgetter(0))
+    body = "Country Name Matches (Retraction Watch -> Scimago)\n" + "=" * 60 + "\n\n"
+    body += "".join(f"{retraction_country} -> {scimago_country}\n"
+                    for retraction_country, scimago_country in match_items)
+    tmp_file = matches_file + '.tmp'
+    Path(tmp_file).write_text(body, encoding='utf-8')
+    os.replace(tmp_file, matches_file)
+    print(f"\nSaved {len(country_matches)} country matches to {matches_file}")
+
+def merge_country_matches(country_matches, matches_file=COUNTRY_MATCHES_FILE):
+    """
+    Merge the fuzzy country matches (Retraction Watch -> Scimago) into matches_file.
+    The file is only rewritten when a match is new or differs from the saved one.
+    """
+    # Read existing matches (cached until the file changes)
+    existing_matches = load_existing_country_matches(matches_file)
+    
+    # Only rewrite the file when a match is new or differs from the existing one
+    new_or_changed = {k: v for k, v in country_matches.items() if existing_matches.get(k) != v}
+    if not new_or_changed:
+        print(f"\nNo new country matches, {matches_file} is up to date")
+        return
+    
+    # Merge matches
+    all_matches = {**existing_matches, **new_or_changed}
+    
+    # Build the whole file up front and write it with a single call, via a temp file
+    # so a crash never leaves a truncated matches file
+    # Names are unique, so sorting the pairs in place by name alone matches sorted(items())
+    match_items = list(all_matches.items())
+    match_items.sort(key=itemgetter(0))
+    body = "Country Name Matches (Retraction Watch -> Scimago)\n" + "=" * 60 + "\n\n"
+    body += "".join(f"{retraction_country} -> {scimago_country}\n"
+                    for retraction_country, scimago_country in match_items)
+    tmp_file = matches_file + '.tmp'
+    Path(tmp_file).write_text(body, encoding='utf-8')
+    os.replace(tmp_file, matches_file)
+    _EXISTING_MATCHES_CACHE[matches_file] = (os.stat(matches_file).st_mtime_ns, all_matches)
+    print(f"\nSaved {len(all_matches)} country matches to {matches_file}")
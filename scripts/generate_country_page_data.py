@@ -2,9 +2,27 @@ import pandas as pd
 import json
 import os
 import re
-from collections import defaultdict
 from datetime import datetime
 
+from dashboard_common import apply_retraction_classification, map_distinct
+
+# orjson is optional - it encodes indented JSON in C, several times faster than the json module
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# pyarrow is optional - its multithreaded CSV reader is much faster than pandas' default engine
+try:
+    import pyarrow
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Columns of the Retraction Watch CSV used to build the country pages
+COUNTRY_PAGE_CSV_COLUMNS = ['Subject', 'Country', 'OriginalPaperDate', 'RetractionDate', 'RetractionNature', 'Reason']
+
 def parse_original_paper_date(date_str):
     """Parse OriginalPaperDate and return year as integer."""
     if pd.isna(date_str):
@@ -84,49 +102,15 @@ def parse_domains(subject_str):
     domains = [d.strip() for d in domains if d.strip()]
     return domains
 
-def apply_retraction_classification(df):
-    """Apply retraction_classification.py logic to add a 'mark' column."""
-    df['mark'] = None
-    
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(script_dir)
-    classification_folder = os.path.join(project_root, 'classification')
-    
-    list_of_marks = ['Supplemental', 'System', 'Research', 'Integrity', 'Serious']
-    
-    for mark in list_of_marks:
-        file_path = os.path.join(classification_folder, mark + '.txt')
-        
-        if not os.path.exists(file_path):
-            continue
-        
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                lines = [line.strip() for line in file if line.strip()]
-            
-            if not lines:
-                continue
-            
-            escaped_lines = [re.escape(line) for line in lines]
-            pattern = '|'.join(escaped_lines)
-            
-            filtered_df = df[df['Reason'].str.contains(pattern, case=False, na=False, regex=True)]
-            df.loc[filtered_df.index, 'mark'] = mark
-            
-        except Exception as e:
-            print(f"Warning: Could not process {file_path}: {e}")
-    
-    # Assign unmarked records to 'Research'
-    if df['mark'].isna().sum() > 0:
-        df.loc[df['mark'].isna(), 'mark'] = 'Research'
-    
-    return df
-
 def get_country_flag_path(country):
     """Get the path to the country flag SVG."""
     country_name = country.replace(' ', '_')
     return f"/country_flags/{country_name}.svg"
 
+def get_country_flag_paths(countries):
+    """Get the flag paths for a batch of countries as a dict of country -> path."""
+    return {country: get_country_flag_path(country) for country in countries}
+
 def load_publication_data(publication_file=None):
     """Load publication data from scimago_combined.csv."""
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -143,23 +127,17 @@ def load_publication_data(publication_file=None):
         print(f"Loading publication data from: {publication_file}")
         pub_df = pd.read_csv(publication_file)
         
-        for _, row in pub_df.iterrows():
-            country = row['Country']
+        # Sum the year columns for all countries at once; missing counts are skipped
+        year_columns = [str(year) for year in range(1996, 2025) if str(year) in pub_df.columns]
+        year_values = pub_df[year_columns]
+        totals = year_values.fillna(0).astype(int).sum(axis=1).tolist()
+        
+        for country, total, counts in zip(pub_df['Country'].tolist(), totals, year_values.to_numpy(dtype=float).tolist()):
             scimago_countries.append(country)
-            
-            total = 0
-            yearly = {}
-            for year in range(1996, 2025):
-                year_str = str(year)
-                if year_str in pub_df.columns:
-                    count = row.get(year_str, 0)
-                    if pd.notna(count):
-                        count = int(count)
-                        total += count
-                        yearly[year_str] = count
-            
             publication_data[country] = total
-            yearly_publication_data[country] = yearly
+            yearly_publication_data[country] = {
+                year_str: int(count) for year_str, count in zip(year_columns, counts) if pd.notna(count)
+            }
     else:
         print(f"Warning: Publication file not found: {publication_file}")
     
@@ -172,10 +150,93 @@ def calculate_retraction_rate(total_retractions, total_publications=None):
     else:
         return round((total_retractions / total_publications) * 1000, 4)
 
+def aggregate_country_data(df, mark_to_category):
+    """
+    Aggregate per-country page statistics with vectorized pandas operations.
+    The semicolon-separated Country column is split, exploded and stripped once per distinct
+    value, then joined back to one row per record/country pair; yearly, mark, domain and
+    collaboration counts are summed with groupby.
+    Returns a dict with country -> data, in order of first appearance.
+    """
+    # Work on the distinct Country values; missing values get code -1
+    countries = df['Country'].astype('category')
+    country_values = pd.Series(countries.cat.categories.astype(str))
+    
+    # Skip values that are unknown as a whole, then split countries (can be multiple,
+    # separated by semicolons) into one entry each, keyed by category code
+    has_country = ~country_values.str.lower().isin(['unknown', 'nan', ''])
+    split_countries = country_values[has_country].str.split(';').explode().str.strip()
+    split_countries = split_countries[split_countries != '']
+    
+    # Years as strings (e.g. '2020'), None where the date could not be parsed;
+    # converted column-wise through nullable integers rather than per row
+    def year_strings(years):
+        return pd.to_numeric(years).astype('Int64').astype('string').to_numpy(dtype=object, na_value=None)
+    
+    # One row per record/country pair; a left merge keeps the records' order
+    long_df = pd.DataFrame({
+        'record': range(len(df)),
+        'code': countries.cat.codes.to_numpy(),
+        'category': df['mark'].map(mark_to_category).fillna('research').to_numpy(),
+        'domains': df['domains'].to_numpy(),
+        'year': year_strings(df['original_paper_year']),
+        'notice_year': year_strings(df['retraction_year'])
+    }).merge(pd.DataFrame({'code': split_countries.index, 'country': split_countries.to_numpy()}),
+             on='code', how='left')
+    long_df = long_df[long_df['country'].notna()].drop(columns='code')
+    
+    # A country gets a page if it has a dated record or a collaborator
+    has_collaborator = long_df.groupby('record')['country'].transform('nunique') > 1
+    listed = long_df['year'].notna() | long_df['notice_year'].notna() | has_collaborator
+    country_data = {
+        country: {
+            'yearly_retractions': {},
+            'notice_yearly_retractions': {},
+            'yearly_data': {},
+            'notice_yearly_data': {},
+            'collaborations': {},
+            'notice_collaborations': {}
+        }
+        for country in pd.unique(long_df.loc[listed, 'country'])
+    }
+    
+    # Yearly data based on OriginalPaperDate ('year') and RetractionDate ('notice_year')
+    for prefix, year_column in [('', 'year'), ('notice_', 'notice_year')]:
+        dated = long_df[long_df[year_column].notna()]
+        
+        for (country, year), count in dated.groupby(['country', year_column], sort=False).size().items():
+            country_data[country][prefix + 'yearly_retractions'][year] = int(count)
+            country_data[country][prefix + 'yearly_data'][year] = {'total': int(count), 'marks': {}, 'domain': {}}
+        
+        mark_counts = dated.groupby(['country', year_column, 'category'], sort=False).size()
+        for (country, year, category), count in mark_counts.items():
+            country_data[country][prefix + 'yearly_data'][year]['marks'][category] = int(count)
+        
+        # Records without domains count under an empty domain
+        domain_rows = dated[['country', year_column, 'domains']].explode('domains')
+        domain_rows['domains'] = domain_rows['domains'].fillna('')
+        domain_counts = domain_rows.groupby(['country', year_column, 'domains'], sort=False).size()
+        for (country, year, domain), count in domain_counts.items():
+            country_data[country][prefix + 'yearly_data'][year]['domain'][domain] = int(count)
+    
+    # Collaborations (other countries in the same record); a left merge keeps the records' order
+    pairs = long_df[['record', 'country']].merge(long_df[['record', 'country']], on='record', how='left',
+                                                 suffixes=('', '_other'))
+    pairs = pairs[pairs['country'] != pairs['country_other']]
+    for (country, other_country), count in pairs.groupby(['country', 'country_other'], sort=False).size().items():
+        country_data[country]['collaborations'][other_country] = int(count)
+        country_data[country]['notice_collaborations'][other_country] = int(count)
+    
+    return country_data
+
 def generate_country_page_data(csv_file_path, output_folder):
     """Generate country page data files for all countries."""
     print(f"Reading CSV file: {csv_file_path}")
-    df = pd.read_csv(csv_file_path)
+    # Only the columns used below, with the pyarrow engine when available; Country and
+    # RetractionNature repeat a few distinct values, so read them as categoricals
+    engine = 'pyarrow' if PYARROW_AVAILABLE else 'c'
+    df = pd.read_csv(csv_file_path, usecols=COUNTRY_PAGE_CSV_COLUMNS, engine=engine,
+                     dtype={'Country': 'category', 'RetractionNature': 'category'})
     
     print(f"Loaded {len(df)} records")
     
@@ -187,44 +248,18 @@ def generate_country_page_data(csv_file_path, output_folder):
     print("Applying retraction classification...")
     df = apply_retraction_classification(df)
     
-    # Parse dates
+    # Parse dates (each distinct date string once)
     print("Parsing dates...")
-    df['original_paper_year'] = df['OriginalPaperDate'].apply(parse_original_paper_date)
-    df['retraction_year'] = df['RetractionDate'].apply(parse_retraction_date)
+    df['original_paper_year'] = map_distinct(df['OriginalPaperDate'], parse_original_paper_date)
+    df['retraction_year'] = map_distinct(df['RetractionDate'], parse_retraction_date)
     
-    # Parse domains
+    # Parse domains (each distinct Subject once)
     print("Parsing domains...")
-    df['domains'] = df['Subject'].apply(parse_domains)
+    df['domains'] = map_distinct(df['Subject'], parse_domains)
     
     # Load publication data
     publication_data, yearly_publication_data, scimago_countries = load_publication_data()
     
-    # Structure to store country data
-    # country_data[country] = {
-    #   'yearly_retractions': {year: count},
-    #   'notice_yearly_retractions': {year: count},
-    #   'yearly_data': {year: {total, marks: {...}, domain: {...}}},
-    #   'notice_yearly_data': {year: {total, marks: {...}, domain: {...}}},
-    #   'collaborations': {country: count},
-    #   'notice_collaborations': {country: count}
-    # }
-    country_data = defaultdict(lambda: {
-        'yearly_retractions': defaultdict(int),
-        'notice_yearly_retractions': defaultdict(int),
-        'yearly_data': defaultdict(lambda: {
-            'total': 0,
-            'marks': defaultdict(int),
-            'domain': defaultdict(int)
-        }),
-        'notice_yearly_data': defaultdict(lambda: {
-            'total': 0,
-            'marks': defaultdict(int),
-            'domain': defaultdict(int)
-        }),
-        'collaborations': defaultdict(int),
-        'notice_collaborations': defaultdict(int)
-    })
-    
     # Mark to category mapping
     mark_to_category = {
         'Supplemental': 'supplemental',
@@ -234,64 +269,26 @@ def generate_country_page_data(csv_file_path, output_folder):
         'Serious': 'alterations'
     }
     
+    # Structure to store country data
+    # country_data[country] = {
+    #   'yearly_retractions': {year: count},
+    #   'notice_yearly_retractions': {year: count},
+    #   'yearly_data': {year: {total, marks: {...}, domain: {...}}},
+    #   'notice_yearly_data': {year: {total, marks: {...}, domain: {...}}},
+    #   'collaborations': {country: count},
+    #   'notice_collaborations': {country: count}
+    # }
     print("Processing records...")
-    for idx, row in df.iterrows():
-        if idx % 10000 == 0:
-            print(f"Processing row {idx}/{len(df)}")
-        
-        # Get countries
-        countries_str = str(row.get('Country', ''))
-        if pd.isna(countries_str) or countries_str.lower() in ['unknown', 'nan', '']:
-            continue
-        
-        countries = [c.strip() for c in countries_str.split(';') if c.strip()]
-        if not countries:
-            continue
-        
-        # Get classification mark
-        mark = row.get('mark')
-        category = mark_to_category.get(mark, 'research')
-        
-        # Get domains
-        domains = row.get('domains', [])
-        if not domains:
-            domains = ['']  # Empty domain
-        
-        # Get years
-        original_year = row.get('original_paper_year')
-        retraction_year = row.get('retraction_year')
-        
-        # Process for each country
-        for country in countries:
-            # Yearly data (based on OriginalPaperDate)
-            if pd.notna(original_year):
-                year_str = str(int(original_year))
-                country_data[country]['yearly_retractions'][year_str] += 1
-                country_data[country]['yearly_data'][year_str]['total'] += 1
-                country_data[country]['yearly_data'][year_str]['marks'][category] += 1
-                for domain in domains:
-                    country_data[country]['yearly_data'][year_str]['domain'][domain] += 1
-            
-            # Notice yearly data (based on RetractionDate)
-            if pd.notna(retraction_year):
-                year_str = str(int(retraction_year))
-                country_data[country]['notice_yearly_retractions'][year_str] += 1
-                country_data[country]['notice_yearly_data'][year_str]['total'] += 1
-                country_data[country]['notice_yearly_data'][year_str]['marks'][category] += 1
-                for domain in domains:
-                    country_data[country]['notice_yearly_data'][year_str]['domain'][domain] += 1
-            
-            # Collaborations (other countries in the same record)
-            for other_country in countries:
-                if other_country != country:
-                    country_data[country]['collaborations'][other_country] += 1
-                    country_data[country]['notice_collaborations'][other_country] += 1
+    country_data = aggregate_country_data(df, mark_to_category)
     
     # Create output folder
     os.makedirs(output_folder, exist_ok=True)
     
     print(f"\nGenerating country page data files...")
     
+    # Flag paths for every country, computed once up front
+    country_flags = get_country_flag_paths(country_data)
+    
     # Generate JSON for each country
     for country, data in country_data.items():
         # Calculate yearly retraction rates (based on OriginalPaperDate)
@@ -368,15 +365,20 @@ def generate_country_page_data(csv_file_path, output_folder):
                 'collaborations': dict(sorted(data['collaborations'].items(), key=lambda x: x[1], reverse=True)),
                 'notice_collaborations': dict(sorted(data['notice_collaborations'].items(), key=lambda x: x[1], reverse=True))
             },
-            'country_flag': get_country_flag_path(country)
+            'country_flag': country_flags[country]
         }
         
         # Write to file
         country_filename = country.replace(' ', '_').replace('/', '_')
         output_path = os.path.join(output_folder, f"{country_filename}_CountryPageData.json")
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
+        if ORJSON_AVAILABLE:
+            # orjson writes UTF-8 without escaping, like ensure_ascii=False
+            with open(output_path, 'wb') as f:
+                f.write(orjson.dumps(output_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        else:
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(output_data, f, indent=2, ensure_ascii=False)
         
         if len(country_data) % 10 == 0:
             print(f"Generated {len(country_data)} country files...")
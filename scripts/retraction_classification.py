@@ -1,38 +1,108 @@
+import os
+import re
+import sys
+from functools import lru_cache
+
 import pandas as pd
 
-# Specify the file path
+# pyahocorasick is optional - one automaton matches the keywords of all marks in a single pass
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# Marks in the order they are applied; when a Reason matches several, the last one wins
+LIST_OF_MARKS = ('Supplemental', 'System', 'Research', 'Integrity', 'Serious')
+
+@lru_cache(maxsize=None)
+def _load_marks(files_dir, marks):
+    """
+    Read the substrings of every mark from <files_dir>/<mark>.txt, once per directory and marks.
+    Blank lines are skipped, as they would match every Reason.
+    Returns a tuple of (mark, lines) pairs, in the order of marks.
+    """
+    lines_by_mark = []
+
+    for mark in marks:
+
+        file_path = os.path.join(files_dir, mark + '.txt')
+
+        # Open the file and read its lines
+        with open(file_path, 'r', encoding='utf-8') as file:
+            lines = tuple(line.strip() for line in file if line.strip())
+
+        lines_by_mark.append((mark, lines))
+
+    return tuple(lines_by_mark)
+
+def classify_retractions(df, marks=LIST_OF_MARKS, files_dir='.'):
+    """
+    Add a 'mark' column to df: the last of marks with one of its substrings in 'Reason'
+    (case-insensitive), left empty for rows matching none.
+    Returns df.
+    """
+    lines_by_mark = _load_marks(files_dir, tuple(marks))
+
+    if AHOCORASICK_AVAILABLE:
+
+        # One automaton over the lowercased substrings of all marks; a substring listed
+        # under several marks keeps the latest one, since later marks win
+        automaton = ahocorasick.Automaton()
+        for rank, (mark, lines) in enumerate(lines_by_mark):
+            for line in lines:
+                automaton.add_word(line.lower(), rank)
+        automaton.make_automaton()
+
+        # Scan each distinct Reason once; the latest mark with a substring present wins,
+        # the same result as applying the marks one after another
+        mark_by_reason = {}
+        for reason in df['Reason'].dropna().unique():
+            ranks = [rank for _, rank in automaton.iter(str(reason).lower())]
+            if ranks:
+                mark_by_reason[reason] = lines_by_mark[max(ranks)][0]
+
+        # Add a new column 'mark' with the matched mark (empty for rows matching none)
+        df['mark'] = df['Reason'].map(mark_by_reason)
+
+    else:
 
-retractions_df = pd.read_csv('data_2025_jul_dec.csv')
+        # Compile one case-insensitive pattern per mark, matching any of its substrings
+        # (escaped, so phrases like "Objections by Author(s)" match literally); a mark
+        # without substrings matches nothing, as in the automaton
+        compiled_patterns = [(mark, re.compile('|'.join(map(re.escape, lines)), re.IGNORECASE))
+                             for mark, lines in lines_by_mark if lines]
 
-list_of_marks = ['Supplemental','System','Research','Integrity','Serious']
+        # Missing reasons match nothing; fill them once rather than in every str.contains
+        reasons = df['Reason'].fillna('')
 
-for mark in list_of_marks:
+        # Start from an empty 'mark' column, so rows matching none are left empty (also
+        # replacing any 'mark' column df already has), as in the automaton path
+        df['mark'] = pd.Series(index=df.index, dtype=object)
 
-    file_path = mark + '.txt'
+        for mark, pattern in compiled_patterns:
 
-    # Initialize an empty list to store the lines
-    lines = []
+            # Boolean mask of rows where the substring is present in 'Reason'
+            mask = reasons.str.contains(pattern)
 
-    # Open the file and read its lines
-    with open(file_path, 'r') as file:
-        lines = [line.strip() for line in file]
+            # Set the current mark for the matching rows
+            df.loc[mask, 'mark'] = mark
 
-    # Now, the 'lines' list contains each line of the file as an element
-    print(lines)
+    return df
 
-    # Define the list of substrings you want to search for
-    #substrings = ['Concerns/Issues About Data', 'Paper Mills']
-    substrings = lines
+if __name__ == '__main__':
 
-    # Create a regular expression pattern to match any of the substrings
-    pattern = '|'.join(substrings)
+    # Specify the file paths (input CSV, output CSV, folder with the <mark>.txt files)
+    input_file = sys.argv[1] if len(sys.argv) > 1 else 'data_2025_jul_dec.csv'
+    output_file = sys.argv[2] if len(sys.argv) > 2 else 'data_2025_jul_dec_with_marks.csv'
+    files_dir = sys.argv[3] if len(sys.argv) > 3 else '.'
 
+    retractions_df = pd.read_csv(input_file)
 
-    # Extract rows where the substring is present in 'column_name'
-    filtered_df = retractions_df[retractions_df['Reason'].str.contains(pattern, case=False)]
+    # Show the substrings of each mark
+    for mark, lines in _load_marks(files_dir, LIST_OF_MARKS):
+        print(list(lines))
 
-    # Add a new column 'mark' and set it to 'grave' for the filtered rows
-    #retractions_df['mark'] = 'unmarked'  # Initialize all rows as 'normal'
-    retractions_df.loc[filtered_df.index, 'mark'] = mark
+    classify_retractions(retractions_df, LIST_OF_MARKS, files_dir)
 
-retractions_df.to_csv('data_2025_jul_dec_with_marks.csv', index=False)
\ No newline at end of file
+    retractions_df.to_csv(output_file, index=False)
@@ -0,0 +1,71 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import retraction_classification
+
+# Substrings of each mark; Research ends with a blank line and Integrity has none
+MARK_LINES = {
+    'Supplemental': ['Error in Data', 'Objections by Author(s)'],
+    'System': ['Compromised Peer Review'],
+    'Research': ['Error in Analyses', ''],
+    'Integrity': [],
+    'Serious': ['Plagiarism', 'Duplication of Data'],
+}
+
+REASONS = [
+    '+Error in Data;',
+    '+Objections by Author(s);+Plagiarism of Article;',
+    '+compromised peer review;+error in analyses;',
+    '+Withdrawal;',
+    None,
+    '+Duplication of Data;+Error in Data;',
+    '',
+]
+
+
+@unittest.skipUnless(retraction_classification.AHOCORASICK_AVAILABLE, 'pyahocorasick is not installed')
+class ClassifyRetractionsTest(unittest.TestCase):
+
+    def setUp(self):
+        files_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(files_dir.cleanup)
+        self.files_dir = files_dir.name
+        for mark, lines in MARK_LINES.items():
+            with open(os.path.join(self.files_dir, mark + '.txt'), 'w') as file:
+                file.write(''.join(line + '\n' for line in lines))
+
+    def classify(self, df, use_automaton):
+        with mock.patch.object(retraction_classification, 'AHOCORASICK_AVAILABLE', use_automaton):
+            return retraction_classification.classify_retractions(df.copy(), files_dir=self.files_dir)
+
+    @staticmethod
+    def marks(df):
+        """The 'mark' column as a list, with None for rows matching no mark."""
+        return df['mark'].astype(object).where(df['mark'].notna(), None).tolist()
+
+    def assert_paths_agree(self, df):
+        automaton_df = self.classify(df, True)
+        regex_df = self.classify(df, False)
+        self.assertEqual(self.marks(automaton_df), self.marks(regex_df))
+        self.assertEqual(automaton_df.to_csv(index=False), regex_df.to_csv(index=False))
+        return automaton_df
+
+    def test_paths_agree(self):
+        df = self.assert_paths_agree(pd.DataFrame({'Reason': REASONS}))
+        expected = ['Supplemental', 'Serious', 'Research', None, None, 'Serious', None]
+        self.assertEqual(self.marks(df), expected)
+
+    def test_paths_agree_with_existing_mark_column(self):
+        df = self.assert_paths_agree(pd.DataFrame({'Reason': REASONS, 'mark': 'Stale'}))
+        self.assertNotIn('Stale', self.marks(df))
+
+
+if __name__ == '__main__':
+    unittest.main()